@@ -1,12 +1,16 @@
-import json
 import logging
+import os
 import re
-from contextlib import contextmanager
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from dataclasses import dataclass
 from pathlib import Path
 from shutil import disk_usage
 from urllib.parse import urljoin, urlparse
 
+import orjson
 import requests
 
 from git_services.cli import GitCLI, GitCommandError
@@ -67,10 +71,26 @@ class Repository:
         return path.rsplit("/", maxsplit=1).pop()
 
 
+def _quote_git_config(value: str) -> str:
+    """Escape a value so that it can be written in double quotes in a git config file."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\t", "\\t")
+    )
+
+
 class GitCloner:
     remote_name = "origin"
     remote_origin_prefix = f"remotes/{remote_name}"
     proxy_url = "http://localhost:8080"
+    max_clone_workers = 4
+    submodule_jobs = os.cpu_count() or 4
+    # NOTE: Persisted in the repository config, which outlives the init container and its CPU count
+    submodule_fetch_jobs = 4
+    lfs_concurrent_transfers = 16
+    partial_clone_filter = "blob:none"
 
     def __init__(
         self,
@@ -82,31 +102,98 @@ class GitCloner:
         is_git_proxy_enabled=False,
     ):
         base_path = Path(workspace_mount_path)
-        logging.basicConfig(level=logging.INFO)
+        # NOTE: Repositories are cloned in separate threads, include the thread name so that
+        # interleaved log lines can be attributed to the right repository.
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(levelname)s:%(threadName)s:%(message)s",
+        )
         self.repositories: list[Repository] = [
             Repository.from_config_repo(r, workspace_mount_path=base_path)
             for r in repositories
         ]
         self.git_providers = {p.id: p for p in git_providers}
-        self.workspace_mount_path = Path(workspace_mount_path)
+        self.workspace_mount_path = base_path
         self.user = user
         self.lfs_auto_fetch = lfs_auto_fetch
         self.is_git_proxy_enabled = is_git_proxy_enabled
         self._access_tokens: dict[str, str | None] = dict()
+        # NOTE: Reuse connections, the access tokens for all providers come from the same host
+        self._session = requests.Session()
+        self._access_tokens_lock = threading.Lock()
+        self._lfs_pull_lock = threading.Lock()
 
     def _initialize_repo(self, repository: Repository):
         logging.info("Initializing repo")
 
         repository.git_cli.git_init()
 
+        settings = {
+            "push.default": "simple",
+            "submodule.fetchJobs": str(self.submodule_fetch_jobs),
+            # NOTE: LFS downloads are I/O bound, the default of 3 parallel transfers is the
+            # bottleneck for repositories with many small LFS files.
+            "lfs.concurrenttransfers": str(self.lfs_concurrent_transfers),
+        }
         # NOTE: For anonymous sessions email and name are not known for the user
         if self.user.email is not None:
             logging.info(f"Setting email {self.user.email} in git config")
-            repository.git_cli.git_config("user.email", self.user.email)
+            settings["user.email"] = self.user.email
         if self.user.full_name is not None:
             logging.info(f"Setting name {self.user.full_name} in git config")
-            repository.git_cli.git_config("user.name", self.user.full_name)
-        repository.git_cli.git_config("push.default", "simple")
+            settings["user.name"] = self.user.full_name
+        self._write_git_config(repository, settings)
+
+    @staticmethod
+    def _format_git_config(settings: dict[str, str]) -> str:
+        sections: dict[str, list[str]] = {}
+        for key, value in settings.items():
+            section, _, name = key.rpartition(".")
+            section, _, subsection = section.partition(".")
+            header = (
+                f'[{section} "{_quote_git_config(subsection)}"]'
+                if subsection
+                else f"[{section}]"
+            )
+            sections.setdefault(header, []).append(
+                f'\t{name} = "{_quote_git_config(value)}"'
+            )
+        lines = [line for header, entries in sections.items() for line in [header, *entries]]
+        return "\n".join(lines) + "\n"
+
+    def _write_git_config(self, repository: Repository, settings: dict[str, str]):
+        """Append settings to the git config of the repository with a single write.
+
+        This avoids running a separate ``git config`` process for every setting, the values
+        written here can still be changed or unset with ``git config`` afterwards.
+        """
+        with open(repository.absolute_path / ".git" / "config", "a") as config_file:
+            config_file.write(self._format_git_config(settings))
+
+    def _remove_git_config(self, repository: Repository, settings: dict[str, str]):
+        """Remove settings that were added with ``_write_git_config`` from the git config.
+
+        The config is rewritten while holding the same lock file that git uses. If the settings
+        are not found as they were written they are unset one by one with ``git config``.
+        """
+        config_path = repository.absolute_path / ".git" / "config"
+        lock_path = repository.absolute_path / ".git" / "config.lock"
+        settings_text = self._format_git_config(settings)
+        with open(lock_path, "x") as lock_file:
+            try:
+                config = config_path.read_text()
+                start = config.find(settings_text)
+                end = start + len(settings_text)
+                # NOTE: Only remove the settings if git did not add other keys to their sections
+                if start >= 0 and (end == len(config) or config[end] == "["):
+                    lock_file.write(config[:start] + config[end:])
+                    lock_file.close()
+                    os.replace(lock_path, config_path)
+                    return
+            finally:
+                lock_path.unlink(missing_ok=True)
+        for key in settings:
+            repository.git_cli.git_config("--unset", key)
 
     @staticmethod
     def _exclude_storages_from_git(repository: Repository, storages: list[str]):
@@ -114,40 +201,44 @@ class GitCloner:
         if not storages:
             return
 
+        repo_parts = repository.absolute_path.parts
+        exclude_paths = [
+            Path(*storage_path.parts[len(repo_parts) :]).as_posix()
+            for storage_path in map(Path, storages)
+            # NOTE: Storage paths that are not inside the repo do not need to be gitignored
+            if len(storage_path.parts) > len(repo_parts)
+            and storage_path.parts[: len(repo_parts)] == repo_parts
+        ]
+        if not exclude_paths:
+            return
+
         with open(
             repository.absolute_path / ".git" / "info" / "exclude", "a"
         ) as exclude_file:
-            exclude_file.write("\n")
-
-            for storage in storages:
-                storage_path = Path(storage)
-                if repository.absolute_path not in storage_path.parents:
-                    # The storage path is not inside the repo, no need to gitignore
-                    continue
-                exclude_path = storage_path.relative_to(
-                    repository.absolute_path
-                ).as_posix()
-                exclude_file.write(f"{exclude_path}\n")
+            exclude_file.write("\n" + "\n".join(exclude_paths) + "\n")
 
     def _get_access_token(self, provider_id: str):
-        if provider_id in self._access_tokens:
+        # NOTE: Repositories are cloned concurrently, the lock makes sure that the token for a
+        # provider is only requested once even if several of its repositories start together.
+        with self._access_tokens_lock:
+            if provider_id in self._access_tokens:
+                return self._access_tokens[provider_id]
+            if provider_id not in self.git_providers:
+                return None
+
+            provider = self.git_providers[provider_id]
+            request_url = provider.access_token_url
+            headers = {"Authorization": f"bearer {self.user.renku_token}"}
+            logging.info(f"Requesting token for provider {provider_id}")
+            res = self._session.get(request_url, headers=headers)
+            if res.status_code != 200:
+                logging.warning(f"Could not get access token for provider {provider_id}")
+                self._access_tokens.pop(provider_id, None)
+                return None
+            token = res.json()
+            logging.info(f"Got token response for {provider_id}")
+            self._access_tokens[provider_id] = token["access_token"]
             return self._access_tokens[provider_id]
-        if provider_id not in self.git_providers:
-            return None
-
-        provider = self.git_providers[provider_id]
-        request_url = provider.access_token_url
-        headers = {"Authorization": f"bearer {self.user.renku_token}"}
-        logging.info(f"Requesting token for provider {provider_id}")
-        res = requests.get(request_url, headers=headers)
-        if res.status_code != 200:
-            logging.warning(f"Could not get access token for provider {provider_id}")
-            del self._access_tokens[provider_id]
-            return None
-        token = res.json()
-        logging.info(f"Got token response for {provider_id}")
-        self._access_tokens[provider_id] = token["access_token"]
-        return self._access_tokens[provider_id]
 
     @contextmanager
     def _temp_plaintext_credentials(
@@ -155,27 +246,37 @@ class GitCloner:
     ):
         # NOTE: If "lfs." is included in urljoin it does not work properly
         lfs_auth_setting = "lfs." + urljoin(f"{repository.url}/", "info/lfs.access")
-        credential_loc = Path("/tmp/git-credentials")
+        # NOTE: Repositories are cloned concurrently so every repository needs its own file
+        fd, credential_path = tempfile.mkstemp(prefix="git-credentials-")
+        credential_loc = Path(credential_path)
+        credential_settings = {
+            lfs_auth_setting: "basic",
+            "credential.helper": f"store --file={credential_loc}",
+        }
         try:
-            with open(credential_loc, "w") as f:
-                git_host = urlparse(repository.url).netloc
-                f.write(f"https://{git_user}:{git_access_token}@{git_host}")
+            git_host = urlparse(repository.url).netloc
+            # NOTE: mkstemp creates the file exclusively and readable only by the current user,
+            # write the credentials through its descriptor with a single write.
+            try:
+                os.write(fd, f"https://{git_user}:{git_access_token}@{git_host}".encode())
+            finally:
+                os.close(fd)
             # NOTE: This is required to let LFS know that it should use basic auth to pull data.
             # If not set LFS will try to pull data without any auth and will then set this field
             # automatically but the password and username will be required for every git
             # operation. Setting this option when basic auth is used to clone with the context
             # manager and then unsetting it prevents getting in trouble when the user is in the
             # session by having this setting left over in the session after initialization.
-            repository.git_cli.git_config(lfs_auth_setting, "basic")
-            yield repository.git_cli.git_config("credential.helper", f"store --file={credential_loc}")
+            self._write_git_config(repository, credential_settings)
+            yield
         finally:
             # NOTE: Temp credentials MUST be cleaned up on context manager exit
             logging.info("Cleaning up git credentials after cloning.")
-            credential_loc.unlink(missing_ok=True)
+            with suppress(FileNotFoundError):
+                os.unlink(credential_loc)
             try:
-                repository.git_cli.git_config("--unset", "credential.helper")
-                repository.git_cli.git_config("--unset", lfs_auth_setting)
-            except GitCommandError as err:
+                self._remove_git_config(repository, credential_settings)
+            except (GitCommandError, OSError) as err:
                 # INFO: The repo is fully deleted when an error occurs so when the context
                 # manager exits then this results in an unnecessary error that masks the true
                 # error, that is why this is ignored.
@@ -192,7 +293,7 @@ class GitCloner:
             res = repository.git_cli.git_lfs("ls-files", "--json")
         except GitCommandError:
             return 0
-        res_json = json.loads(res)
+        res_json = orjson.loads(res)
         size_bytes = 0
         files = res_json.get("files", [])
         if not files:
@@ -218,23 +319,32 @@ class GitCloner:
         match_dict = match.groupdict()
         return match_dict["branch"]
 
-    def _clone(self, repository: Repository):
-        logging.info(f"Cloning repository {repository.dirname} from {repository.url}")
+    def _add_remote(self, repository: Repository) -> list[str]:
+        """Add the remote of the repository and return the extra arguments to fetch it with."""
         if self.lfs_auto_fetch:
             repository.git_cli.git_lfs("install", "--local")
         else:
             repository.git_cli.git_lfs("install", "--skip-smudge", "--local")
         repository.git_cli.git_remote("add", self.remote_name, repository.url)
+        fetch_args = []
+        if not self.lfs_auto_fetch:
+            # NOTE: Do a blobless partial clone, only the blobs needed for the checkout are
+            # downloaded and the rest are fetched on demand. This is skipped when LFS files are
+            # pulled because LFS would then fetch the blobs of all pointer files one by one.
+            self._write_git_config(
+                repository,
+                {
+                    f"remote.{self.remote_name}.promisor": "true",
+                    f"remote.{self.remote_name}.partialclonefilter": self.partial_clone_filter,
+                },
+            )
+            fetch_args.append(f"--filter={self.partial_clone_filter}")
+        return fetch_args
+
+    @staticmethod
+    def _checkout(repository: Repository, *args: str):
         try:
-            repository.git_cli.git_fetch(self.remote_name)
-        except GitCommandError as err:
-            raise errors.GitFetchError from err
-        branch = repository.branch or self._get_default_branch(
-            repository=repository, remote_name=self.remote_name
-        )
-        logging.info(f"Checking out branch {branch}")
-        try:
-            repository.git_cli.git_checkout(branch)
+            repository.git_cli.git_checkout(*args)
         except GitCommandError as err:
             if err.returncode != 0 or len(err.stderr) != 0:
                 if "no space left on device" in str(err.stderr).lower():
@@ -242,23 +352,119 @@ class GitCloner:
                     raise errors.NoDiskSpaceError from err
                 else:
                     raise errors.BranchDoesNotExistError from err
+
+    def _pull_lfs_and_submodules(self, repository: Repository):
         if self.lfs_auto_fetch:
             total_lfs_size_bytes = self._get_lfs_total_size_bytes(repository)
-            _, _, free_space_bytes = disk_usage(repository.absolute_path.as_posix())
-            if free_space_bytes < total_lfs_size_bytes:
-                raise errors.NoDiskSpaceError
-            repository.git_cli.git_lfs("install", "--local")
-            repository.git_cli.git_lfs("pull")
+            # NOTE: Repositories are cloned concurrently, the free space check and the pull have
+            # to happen together so that several pulls cannot pass the check and overfill the disk.
+            with self._lfs_pull_lock:
+                _, _, free_space_bytes = disk_usage(repository.absolute_path)
+                if free_space_bytes < total_lfs_size_bytes:
+                    raise errors.NoDiskSpaceError
+                repository.git_cli.git_lfs("install", "--local")
+                repository.git_cli.git_lfs("pull")
         try:
             logging.info("Dealing with submodules")
-            repository.git_cli.git_submodule("init")
-            repository.git_cli.git_submodule("update")
+            repository.git_cli.git_submodule(
+                "update", "--init", "--recursive", f"--jobs={self.submodule_jobs}"
+            )
         except GitCommandError as err:
             logging.error(msg="Couldn't initialize submodules", exc_info=err)
 
+    def _clone(self, repository: Repository):
+        logging.info(f"Cloning repository {repository.dirname} from {repository.url}")
+        fetch_args = self._add_remote(repository)
+        try:
+            repository.git_cli.git_fetch(self.remote_name, *fetch_args)
+        except GitCommandError as err:
+            raise errors.GitFetchError from err
+        branch = repository.branch or self._get_default_branch(
+            repository=repository, remote_name=self.remote_name
+        )
+        logging.info(f"Checking out branch {branch}")
+        self._checkout(repository, branch)
+        self._pull_lfs_and_submodules(repository)
+
+    def _remote_branch_exists(self, repository: Repository, branch: str) -> bool:
+        try:
+            res = repository.git_cli.git_rev_parse(
+                "--verify", "--quiet", f"refs/{self.remote_origin_prefix}/{branch}"
+            )
+        except GitCommandError:
+            return False
+        return res.strip() != ""
+
+    def _clone_commit(self, repository: Repository):
+        """Clone the requested commit of the repository and check it out directly.
+
+        If the branch is known only that branch is fetched together with the commit, the branch
+        is created at the commit and tracks the remote branch. Otherwise only the commit is
+        fetched without any history and checked out detached.
+        """
+        logging.info(
+            f"Cloning commit {repository.commit_sha} of repository {repository.dirname} "
+            f"from {repository.url}"
+        )
+        remote_fetch_args = self._add_remote(repository)
+        if repository.branch:
+            # NOTE: The history of the branch is needed to compute how far the commit is behind
+            # the remote branch, so the fetch cannot be shallow in this case.
+            fetch_args = [
+                *remote_fetch_args,
+                repository.commit_sha,
+                f"+refs/heads/{repository.branch}:refs/{self.remote_origin_prefix}/{repository.branch}",
+            ]
+        else:
+            fetch_args = [*remote_fetch_args, "--depth=1", repository.commit_sha]
+        try:
+            repository.git_cli.git_fetch(self.remote_name, *fetch_args)
+        except GitCommandError as err:
+            # NOTE: Not all servers allow fetching commits by their SHA
+            logging.warning(
+                f"Could not fetch commit {repository.commit_sha} directly, "
+                f"fetching the whole repository instead: {err}"
+            )
+            try:
+                repository.git_cli.git_fetch(self.remote_name, *remote_fetch_args)
+            except GitCommandError as err:
+                raise errors.GitFetchError from err
+            # NOTE: The direct fetch also fails if the branch does not exist on the remote
+            if repository.branch and not self._remote_branch_exists(repository, repository.branch):
+                raise errors.BranchDoesNotExistError
+        if repository.branch:
+            logging.info(f"Checking out branch {repository.branch} at {repository.commit_sha}")
+            self._checkout(repository, "-B", repository.branch, repository.commit_sha)
+            self._write_git_config(
+                repository,
+                {
+                    f"branch.{repository.branch}.remote": self.remote_name,
+                    f"branch.{repository.branch}.merge": f"refs/heads/{repository.branch}",
+                },
+            )
+        else:
+            logging.info(f"Checking out commit {repository.commit_sha}")
+            self._checkout(repository, "--detach", repository.commit_sha)
+        self._pull_lfs_and_submodules(repository)
+
     def run(self, storage_mounts: list[str]):
+        if not self.repositories:
+            return
+        # NOTE: Repositories that resolve to the same path are handled sequentially by the same
+        # thread so that only the first one is cloned and the rest see that it already exists.
+        repositories_by_path: dict[Path, list[Repository]] = {}
         for repository in self.repositories:
-            self.run_helper(repository, storage_mounts=storage_mounts)
+            repositories_by_path.setdefault(repository.absolute_path.resolve(), []).append(repository)
+
+        def run_group(repositories: list[Repository]):
+            for repository in repositories:
+                self.run_helper(repository, storage_mounts=storage_mounts)
+
+        # NOTE: Cloning is network-bound so the repositories are cloned concurrently, consuming
+        # the results of map re-raises the first error from any of the threads.
+        max_workers = min(len(repositories_by_path), self.max_clone_workers)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clone") as executor:
+            list(executor.map(run_group, repositories_by_path.values()))
 
     def run_helper(self, repository: Repository, *, storage_mounts: list[str]):
         logging.info("Checking if the repo already exists.")
@@ -276,11 +482,9 @@ class GitCloner:
 
         self._initialize_repo(repository)
         try:
-            if self.user.is_anonymous:
-                self._clone(repository)
-                if repository.commit_sha:
-                    repository.git_cli.git_reset("--hard", repository.commit_sha)
-            elif git_access_token is None:
+            if self.user.is_anonymous and repository.commit_sha:
+                self._clone_commit(repository)
+            elif self.user.is_anonymous or git_access_token is None:
                 self._clone(repository)
             else:
                 with self._temp_plaintext_credentials(
@@ -316,5 +520,6 @@ class GitCloner:
             logging.info("Skipping git proxy setup")
             return
         logging.info(f"Setting up git proxy to {self.proxy_url}")
-        repository.git_cli.git_config("http.proxy", self.proxy_url)
-        repository.git_cli.git_config("http.sslVerify", "false")
+        self._write_git_config(
+            repository, {"http.proxy": self.proxy_url, "http.sslVerify": "false"}
+        )
@@ -1,73 +1,87 @@
 import contextlib
 import json
+from dataclasses import dataclass
+from functools import cached_property
 from typing import Any, Optional
 
 from ...config import config
 from .cloud_storage.existing import ExistingCloudStorage
 
 
+@dataclass(slots=True)
+class ManifestServerOptions:
+    """Server options as they are set in the manifest of an existing session."""
+
+    defaultUrl: str
+    disk_request: str | float | None = None
+    mem_request: str | int | None = None
+    cpu_request: str | float | None = None
+    gpu_request: str | int | None = None
+    ephemeral_storage: str | float | None = None
+    lfs_auto_fetch: bool | None = None
+
+
 class UserServerManifest:
     def __init__(self, manifest: dict[str, Any]) -> None:
         self.manifest = manifest
+        # NOTE: Bind the sub-dictionaries that the properties below read from only once
+        self._metadata: dict[str, Any] = manifest["metadata"]
+        self._spec: dict[str, Any] = manifest["spec"]
+        self._js: dict[str, Any] = self._spec.get("jupyterServer", {})
+        self._routing: dict[str, Any] = self._spec.get("routing", {})
 
     @property
     def name(self) -> str:
-        return self.manifest["metadata"]["name"]
+        return self._metadata["name"]
 
     @property
     def image(self) -> str:
-        return self.manifest["spec"]["jupyterServer"]["image"]
+        return self._js["image"]
 
     @property
     def using_default_image(self) -> bool:
         return self.image == config.sessions.default_image
 
-    @property
-    def server_options(self) -> dict[str, Any]:
-        js = self.manifest
-        server_options = {}
-        # url
-        server_options["defaultUrl"] = js["spec"]["jupyterServer"]["defaultUrl"]
-        # disk
-        server_options["disk_request"] = js["spec"]["storage"].get("size")
+    @cached_property
+    def server_options(self) -> ManifestServerOptions:
+        disk_request = self._spec["storage"].get("size")
         # NOTE: Amalthea accepts only strings for disk request, but k8s allows bytes as number
         # so try to convert to number if possible
         with contextlib.suppress(ValueError):
-            server_options["disk_request"] = float(server_options["disk_request"])
-        # cpu, memory, gpu, ephemeral storage
-        k8s_res_name_xref = {
-            "memory": "mem_request",
-            "nvidia.com/gpu": "gpu_request",
-            "cpu": "cpu_request",
-            "ephemeral-storage": "ephemeral-storage",
-        }
-        js_resources = js["spec"]["jupyterServer"]["resources"]["requests"]
-        for k8s_res_name in k8s_res_name_xref:
-            if k8s_res_name in js_resources:
-                server_options[k8s_res_name_xref[k8s_res_name]] = js_resources[k8s_res_name]
+            disk_request = float(disk_request)
+        js_resources = self._js["resources"]["requests"]
+        ephemeral_storage = js_resources.get("ephemeral-storage")
         # adjust ephemeral storage properly based on whether persistent volumes are used
-        if "ephemeral-storage" in server_options:
-            server_options["ephemeral-storage"] = (
-                server_options["ephemeral-storage"]
-                if config.sessions.storage.pvs_enabled
-                else server_options["disk_request"]
-            )
-        # lfs auto fetch
-        for patches in js["spec"]["patches"]:
-            for patch in patches.get("patch", []):
-                if patch.get("path") == "/statefulset/spec/template/spec/initContainers/-":
-                    for env in patch.get("value", {}).get("env", []):
-                        if env.get("name") == "GIT_CLONE_LFS_AUTO_FETCH":
-                            server_options["lfs_auto_fetch"] = env.get("value") == "1"
-        return server_options
+        if ephemeral_storage is not None and not config.sessions.storage.pvs_enabled:
+            ephemeral_storage = disk_request
+        lfs_auto_fetch = next(
+            (
+                env.get("value") == "1"
+                for patches in self._spec["patches"]
+                for patch in patches.get("patch", [])
+                if patch.get("path") == "/statefulset/spec/template/spec/initContainers/-"
+                for env in patch.get("value", {}).get("env", [])
+                if env.get("name") == "GIT_CLONE_LFS_AUTO_FETCH"
+            ),
+            None,
+        )
+        return ManifestServerOptions(
+            defaultUrl=self._js["defaultUrl"],
+            disk_request=disk_request,
+            mem_request=js_resources.get("memory"),
+            cpu_request=js_resources.get("cpu"),
+            gpu_request=js_resources.get("nvidia.com/gpu"),
+            ephemeral_storage=ephemeral_storage,
+            lfs_auto_fetch=lfs_auto_fetch,
+        )
 
     @property
     def annotations(self) -> dict[str, str]:
-        return self.manifest["metadata"]["annotations"]
+        return self._metadata["annotations"]
 
     @property
     def labels(self) -> dict[str, str]:
-        return self.manifest["metadata"]["labels"]
+        return self._metadata["labels"]
 
     @property
     def cloudstorage(self) -> list[ExistingCloudStorage]:
@@ -75,12 +89,12 @@ class UserServerManifest:
 
     @property
     def server_name(self) -> str:
-        return self.manifest["metadata"]["name"]
+        return self._metadata["name"]
 
-    @property
+    @cached_property
     def hibernation(self) -> Optional[dict[str, Any]]:
         """Return hibernation annotation."""
-        hibernation = self.manifest["metadata"]["annotations"].get("hibernation")
+        hibernation = self._metadata["annotations"].get("hibernation")
         return json.loads(hibernation) if hibernation else None
 
     @property
@@ -100,12 +114,9 @@ class UserServerManifest:
         hibernation = self.hibernation or {}
         return hibernation.get("branch")
 
-    @property
+    @cached_property
     def url(self) -> str:
-        host = self.manifest["spec"]["routing"]["host"]
-        path = self.manifest["spec"]["routing"]["path"].rstrip("/")
-        token = self.manifest["spec"]["auth"].get("token", "")
-        url = f"https://{host}{path}"
-        if token and len(token) > 0:
-            url += f"?token={token}"
-        return url
+        host = self._routing["host"]
+        path = self._routing["path"].rstrip("/")
+        token = self._spec["auth"].get("token")
+        return f"https://{host}{path}?token={token}" if token else f"https://{host}{path}"
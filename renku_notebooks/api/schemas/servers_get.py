@@ -434,23 +434,18 @@ class LaunchNotebookResponseWithoutStorage(Schema):
 
         def get_resource_requests(server: UserServerManifest):
             server_options = server.server_options
-            server_options_keys = server_options.keys()
             # translate the cpu weird numeric string to a normal number
             # ref: https://kubernetes.io/docs/concepts/configuration/
             #   manage-compute-resources-container/#how-pods-with-resource-limits-are-run
             resources = {}
-            if "cpu_request" in server_options_keys:
-                resources["cpu"] = CpuField().deserialize(server_options["cpu_request"])
-            if "mem_request" in server_options_keys:
-                resources["memory"] = ByteSizeField().deserialize(server_options["mem_request"])
-            if (
-                "disk_request" in server_options_keys
-                and server_options["disk_request"] is not None
-                and server_options["disk_request"] != ""
-            ):
-                resources["storage"] = ByteSizeField().deserialize(server_options["disk_request"])
-            if "gpu_request" in server_options_keys:
-                gpu_request = GpuField().deserialize(server_options["gpu_request"])
+            if server_options.cpu_request is not None:
+                resources["cpu"] = CpuField().deserialize(server_options.cpu_request)
+            if server_options.mem_request is not None:
+                resources["memory"] = ByteSizeField().deserialize(server_options.mem_request)
+            if server_options.disk_request is not None and server_options.disk_request != "":
+                resources["storage"] = ByteSizeField().deserialize(server_options.disk_request)
+            if server_options.gpu_request is not None:
+                gpu_request = GpuField().deserialize(server_options.gpu_request)
                 if gpu_request > 0:
                     resources["gpu"] = gpu_request
             return resources
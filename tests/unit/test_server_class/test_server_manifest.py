@@ -0,0 +1,118 @@
+import json
+from typing import Any
+
+import pytest
+
+from renku_notebooks.api.classes.server_manifest import ManifestServerOptions, UserServerManifest
+
+
+@pytest.fixture
+def manifest() -> dict[str, Any]:
+    return {
+        "metadata": {
+            "name": "test-server",
+            "annotations": {
+                "hibernation": json.dumps({"dirty": True, "commit": "abcdefg", "branch": "master"}),
+            },
+            "labels": {},
+        },
+        "spec": {
+            "auth": {"token": ""},
+            "jupyterServer": {
+                "defaultUrl": "/lab",
+                "image": "renku/singleuser:latest",
+                "resources": {"requests": {"cpu": 0.5, "memory": "1G"}},
+            },
+            "patches": [],
+            "routing": {"host": "renkulab.io", "path": "/sessions/test-server/"},
+            "storage": {"size": "1G"},
+        },
+    }
+
+
+def test_hibernation(manifest):
+    server = UserServerManifest(manifest)
+
+    assert server.hibernation == {"dirty": True, "commit": "abcdefg", "branch": "master"}
+    assert server.dirty
+    assert server.hibernation_commit == "abcdefg"
+    assert server.hibernation_branch == "master"
+
+
+def test_hibernation_is_parsed_once(manifest, mocker):
+    loads = mocker.patch("renku_notebooks.api.classes.server_manifest.json.loads", wraps=json.loads)
+    server = UserServerManifest(manifest)
+
+    assert server.dirty
+    assert server.hibernation_commit == "abcdefg"
+    assert server.hibernation_branch == "master"
+    assert loads.call_count == 1
+
+
+def test_no_hibernation(manifest):
+    del manifest["metadata"]["annotations"]["hibernation"]
+    server = UserServerManifest(manifest)
+
+    assert server.hibernation is None
+    assert server.hibernation_commit is None
+    assert server.hibernation_branch is None
+
+
+def test_server_options(manifest):
+    manifest["spec"]["patches"] = [
+        {
+            "type": "application/json-patch+json",
+            "patch": [
+                {
+                    "op": "add",
+                    "path": "/statefulset/spec/template/spec/initContainers/-",
+                    "value": {
+                        "name": "git-clone",
+                        "env": [
+                            {"name": "GIT_CLONE_REPO_URL", "value": "https://gitlab-url.com/namespace/project"},
+                            {"name": "GIT_CLONE_LFS_AUTO_FETCH", "value": "1"},
+                        ],
+                    },
+                }
+            ],
+        }
+    ]
+    server = UserServerManifest(manifest)
+
+    assert server.server_options == ManifestServerOptions(
+        defaultUrl="/lab",
+        disk_request="1G",
+        cpu_request=0.5,
+        mem_request="1G",
+        lfs_auto_fetch=True,
+    )
+
+
+def test_server_options_without_lfs_patch(manifest):
+    manifest["spec"]["storage"]["size"] = "1000000000"
+    server = UserServerManifest(manifest)
+
+    assert server.server_options == ManifestServerOptions(
+        defaultUrl="/lab",
+        disk_request=1000000000.0,
+        cpu_request=0.5,
+        mem_request="1G",
+    )
+
+
+def test_manifest_properties(manifest):
+    server = UserServerManifest(manifest)
+
+    assert server.name == "test-server"
+    assert server.server_name == "test-server"
+    assert server.image == "renku/singleuser:latest"
+    assert server.annotations == manifest["metadata"]["annotations"]
+    assert server.labels == {}
+    assert server.url == "https://renkulab.io/sessions/test-server"
+
+
+def test_url_with_token(manifest):
+    manifest["spec"]["auth"]["token"] = "secret-token"
+    server = UserServerManifest(manifest)
+
+    assert server.url == "https://renkulab.io/sessions/test-server?token=secret-token"